@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-import gzip
+import io
 import sqlite3
 import os
 import re
@@ -8,6 +8,20 @@ from datetime import datetime
 import sys
 import traceback
 import logging
+import queue
+import threading
+
+# Prefer ISA-L accelerated gzip decompression when available
+try:
+    from isal import igzip as gzip_mod
+except ImportError:
+    import gzip as gzip_mod
+
+# rapidgzip decompresses a single file in parallel chunks across all cores
+try:
+    import rapidgzip
+except ImportError:
+    rapidgzip = None
 
 # Configure logging
 logging.basicConfig(
@@ -20,26 +34,87 @@ logger = logging.getLogger("create_log_db")
 # Define the database file
 DB_FILE = "logs.db"
 
+# Read size for the decompressed stream (CPython's gzip default since gh-95534)
+READ_BUFFER_SIZE = 128 * 1024
+
+# Smallest compressed file worth splitting across rapidgzip's parallel workers;
+# below this ISA-L or zlib decompress it faster on their own
+RAPIDGZIP_MIN_SIZE = 16 * 1024 * 1024
+
+# Rows per executemany call; larger batches amortize statement overhead
+BATCH_SIZE = 20000
+
+# Maximum number of batches waiting for the writer thread
+WRITE_QUEUE_SIZE = 8
+
+LOG_INSERT_SQL = "INSERT INTO logs (id, timestamp, thread, level, module, message, source_file, raw_log, has_stack_trace) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+ERROR_INSERT_SQL = "INSERT INTO parsing_errors (line, source_file, error_message) VALUES (?, ?, ?)"
+STACK_TRACE_INSERT_SQL = "INSERT INTO stack_traces (log_id, stack_trace) VALUES (?, ?)"
+
 # Improved regular expression pattern for the log format
 # Format: 2025-03-06 00:00:00,024 [UserServer-2] INFO  c.d.s.r.user.EnterpriseUserRPCServer - [USER]: Channel ...
-LOG_PATTERN = r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}) \[([^\]]+)\] (\w+)\s+([^\s-]+) - (.+)$'
+# Every log line starts with the timestamp, thread and level; looks_like_timestamp
+# checks the fixed separator positions of this prefix without the regex
+LOG_PREFIX_PATTERN = r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}) \[([^\]]+)\] (\w+)\s+'
+
+# The primary pattern splits the rest into module and message
+PRIMARY_BODY_PATTERN = r'([^\s-]+) - (.+)'
+LOG_PATTERN = LOG_PREFIX_PATTERN + PRIMARY_BODY_PATTERN + '$'
 
 # Alternative pattern for logs that might not match the primary pattern
-ALT_LOG_PATTERN = r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}) \[([^\]]+)\] (\w+)\s+(.+)$'
+ALT_BODY_PATTERN = r'(.+)'
+ALT_LOG_PATTERN = LOG_PREFIX_PATTERN + ALT_BODY_PATTERN + '$'
 
-# Pattern to detect the start of a Java stack trace
-STACK_TRACE_START_PATTERN = r'^(java\.\w+\.\w+Exception|Caused by:|at [\w\.]+\()'
+# Pattern to detect Java stack trace lines; any alternative may be indented
+STACK_TRACE_START_PATTERN = r'^\s*(java\.\w+\.\w+Exception|Caused by:|at )'
+
+# Compile the patterns once at import time
+# LOG_PATTERN and ALT_LOG_PATTERN in one pass: groups 4-5 are the primary module
+# and message, group 6 is the message when only the alternative pattern matches
+LOG_LINE_RE = re.compile(f'{LOG_PREFIX_PATTERN}(?:{PRIMARY_BODY_PATTERN}|{ALT_BODY_PATTERN})$')
+STACK_RE = re.compile(STACK_TRACE_START_PATTERN)
+
+# Shared copies of repeated field values (threads, levels, modules)
+FIELD_INTERN = {}
+intern_field = FIELD_INTERN.setdefault
+
+# Line kinds returned by parse_log_line
+NEW_PRIMARY = 0
+NEW_ALT = 1
+STACK = 2
+CONTINUATION = 3
 
 def create_database():
     """Create the SQLite database and tables"""
     # Remove existing database if it exists
     if os.path.exists(DB_FILE):
         os.remove(DB_FILE)
-        logger.info(f"Removed existing {DB_FILE}")
+        logger.info("Removed existing %s", DB_FILE)
+    
+    # Remove write-ahead log files left behind by an interrupted run
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(DB_FILE + suffix):
+            os.remove(DB_FILE + suffix)
     
-    conn = sqlite3.connect(DB_FILE)
+    # The connection is shared with the writer thread in process_log_files,
+    # which joins the writer before committing or rolling back. Autocommit
+    # mode lets process_log_files manage one explicit transaction per file.
+    conn = sqlite3.connect(DB_FILE, isolation_level=None, cached_statements=256, check_same_thread=False)
     cursor = conn.cursor()
     
+    # Tune SQLite for bulk loading. WAL with synchronous=NORMAL only syncs at
+    # checkpoints, and keeps rollback working for a file that fails to load.
+    # Foreign keys are off by default, but builds compiled with them on would
+    # otherwise check stack_traces.log_id on every insert.
+    cursor.executescript('''
+    PRAGMA journal_mode = WAL;
+    PRAGMA synchronous = NORMAL;
+    PRAGMA temp_store = MEMORY;
+    PRAGMA cache_size = -262144;
+    PRAGMA mmap_size = 268435456;
+    PRAGMA foreign_keys = OFF;
+    ''')
+    
     # Create logs table
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS logs (
@@ -81,69 +156,104 @@ def create_database():
 
 def is_stack_trace_line(line):
     """Check if a line is part of a stack trace"""
-    return re.match(STACK_TRACE_START_PATTERN, line) is not None or line.strip().startswith("at ") or "Exception" in line
+    # Only called for lines that are not log entries, so the substring scan
+    # stays off the common path
+    return STACK_RE.match(line) is not None or "Exception" in line
+
+def looks_like_timestamp(line):
+    """Cheap check for the 'YYYY-MM-DD HH:MM:SS,mmm [' prefix of a log line"""
+    return (len(line) > 24 and line[4] == '-' and line[7] == '-' and line[10] == ' '
+            and line[13] == ':' and line[19] == ',' and line[23] == ' ' and line[24] == '[')
 
 def parse_log_line(line, source_file):
-    """Parse a log line and return a dictionary of values"""
-    # Try to parse as structured log with primary pattern
-    match = re.match(LOG_PATTERN, line)
-    if match:
-        timestamp, thread, level, module, message = match.groups()
-        return {
-            "timestamp": timestamp,
-            "thread": thread,
-            "level": level,
-            "module": module,
-            "message": message,
-            "source_file": source_file,
-            "raw_log": line,
-            "parsed": True
-        }
-    
-    # Try alternative pattern
-    match = re.match(ALT_LOG_PATTERN, line)
+    """Parse a log line and return a (kind, values) tuple"""
+    # Try to parse as structured log with the primary or alternative pattern;
+    # only lines with a timestamp prefix can match
+    match = LOG_LINE_RE.match(line) if looks_like_timestamp(line) else None
     if match:
-        timestamp, thread, level, message = match.groups()
+        timestamp, thread, level, module, message, alt_message = match.groups()
+        # Threads, levels and modules come from small sets; share one string per value
+        thread = intern_field(thread, thread)
+        level = intern_field(level, level)
+        if module is not None:
+            module = intern_field(module, module)
+            return NEW_PRIMARY, {
+                "timestamp": timestamp,
+                "thread": thread,
+                "level": level,
+                "module": module,
+                "message": message,
+                "source_file": source_file,
+                "raw_log": line
+            }
+        
         # In this case, we don't have a separate module, so we'll use an empty string
-        return {
+        return NEW_ALT, {
             "timestamp": timestamp,
             "thread": thread,
             "level": level,
             "module": "",
-            "message": message,
+            "message": alt_message,
             "source_file": source_file,
-            "raw_log": line,
-            "parsed": True
+            "raw_log": line
         }
     
     # Check if it's a stack trace line
     if is_stack_trace_line(line):
-        return {
-            "is_stack_trace": True,
-            "stack_trace_line": line,
-            "parsed": True
+        return STACK, {
+            "stack_trace_line": line
         }
     
-    # If we can't parse it in a structured way, just store the raw log
-    # and record it as a parsing error
-    return {
-        "timestamp": "",
-        "thread": "",
-        "level": "",
-        "module": "",
-        "message": line,
-        "source_file": source_file,
-        "raw_log": line,
-        "parsed": False,
-        "error": "Could not parse log line with any pattern"
-    }
+    # Anything else continues the previous log entry; the caller records it
+    # as a parsing error when there is no entry to attach it to
+    return CONTINUATION, None
+
+def open_log_file(log_file):
+    """Open a gzip log file as a text stream with a large read buffer"""
+    if rapidgzip is not None and os.path.getsize(log_file) >= RAPIDGZIP_MIN_SIZE:
+        stream = rapidgzip.open(log_file, parallelization=os.cpu_count())
+    else:
+        stream = io.BufferedReader(gzip_mod.open(log_file, 'rb'), buffer_size=READ_BUFFER_SIZE)
+    return io.TextIOWrapper(stream, encoding='utf-8', errors='replace')
+
+def prefetch_file(path):
+    """Ask the kernel to start reading a file into the page cache in the background"""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+    except OSError as e:
+        logger.debug("Could not prefetch %s: %s", path, e)
 
 def find_gz_files():
     """Find all .gz files in the current directory"""
     gz_files = glob.glob("*.gz")
-    logger.info(f"Found {len(gz_files)} .gz files: {', '.join(gz_files)}")
+    logger.info("Found %d .gz files: %s", len(gz_files), ', '.join(gz_files))
     return gz_files
 
+def log_rows(batch):
+    """Join the message and raw_log fragments of batched log entries into rows"""
+    for log_id, timestamp, thread, level, module, message, source_file, raw_log, has_stack_trace in batch:
+        yield log_id, timestamp, thread, level, module, "\n".join(message), source_file, "\n".join(raw_log), has_stack_trace
+
+def write_batches(cursor, write_queue, errors):
+    """Writer thread: insert (sql, rows) batches from the queue until a None sentinel"""
+    while True:
+        item = write_queue.get()
+        if item is None:
+            break
+        # After a failure keep draining so the producer never blocks on a full queue
+        if errors:
+            continue
+        try:
+            cursor.executemany(*item)
+        except Exception as e:
+            errors.append(e)
+
 def process_log_files(conn, cursor):
     """Process all log files and insert into database"""
     # Find all .gz files in the current directory
@@ -157,93 +267,103 @@ def process_log_files(conn, cursor):
     total_stack_traces = 0
     total_errors = 0
     
-    for log_file in log_files:
+    # Log IDs are assigned here rather than read back from the writer thread,
+    # so stack traces can reference their parent entry before it is inserted
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM logs")
+    next_log_id = cursor.fetchone()[0] + 1
+    
+    prefetch_file(log_files[0])
+    
+    for index, log_file in enumerate(log_files):
         if not os.path.exists(log_file):
-            logger.warning(f"Log file {log_file} not found, skipping.")
+            logger.warning("Log file %s not found, skipping.", log_file)
             continue
         
-        logger.info(f"Processing {log_file}...")
+        # Read the next file from disk while this one is decompressed and parsed
+        if index + 1 < len(log_files):
+            prefetch_file(log_files[index + 1])
+        
+        logger.info("Processing %s...", log_file)
         file_logs = 0
         file_stack_traces = 0
         file_errors = 0
+        file_first_log_id = next_log_id
+        
+        # Each file is loaded in its own transaction
+        cursor.execute("BEGIN IMMEDIATE")
+        
+        # Parsing runs on this thread while a writer thread inserts finished batches
+        write_queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        writer_errors = []
+        writer = threading.Thread(target=write_batches, args=(cursor, write_queue, writer_errors))
+        writer.start()
         
         try:
-            # Open and decompress the gzip file
-            with gzip.open(log_file, 'rt', encoding='utf-8', errors='replace') as f:
-                batch = []
-                error_batch = []
-                stack_trace_batch = []
-                batch_size = 1000
-                line_count = 0
-                
-                # Variables to track multi-line log entries
-                current_log_entry = None
-                current_stack_trace = []
-                last_log_id = None
-                
-                for line in f:
-                    line_count += 1
-                    line = line.strip()
-                    if not line:
-                        continue
+            try:
+                # Open and decompress the gzip file
+                with open_log_file(log_file) as f:
+                    batch = []
+                    error_batch = []
+                    stack_trace_batch = []
+                    line_count = 0
                     
-                    try:
-                        # Check if this is a new log entry or continuation of previous
-                        is_new_log = re.match(LOG_PATTERN, line) is not None or re.match(ALT_LOG_PATTERN, line) is not None
-                        
-                        # If we have a stack trace and this is a new log, save the stack trace
-                        if current_stack_trace and is_new_log and last_log_id is not None:
-                            stack_trace_text = "\n".join(current_stack_trace)
-                            stack_trace_batch.append((last_log_id, stack_trace_text))
-                            current_stack_trace = []
-                            file_stack_traces += 1
-                        
-                        # Parse the line
-                        parsed = parse_log_line(line, log_file)
+                    # Variables to track multi-line log entries
+                    current_log_id = None
+                    current_stack_trace = []
+                    
+                    for line in f:
+                        line_count += 1
+                        # Keep leading whitespace, which carries stack frame indentation
+                        line = line.rstrip('\r\n')
+                        if not line or line.isspace():
+                            continue
                         
-                        if is_new_log:
-                            # This is a new log entry
-                            if parsed.get("parsed", False):
+                        try:
+                            # Parse the line and check if it starts a new log entry
+                            kind, parsed = parse_log_line(line, log_file)
+                            is_new_log = kind == NEW_PRIMARY or kind == NEW_ALT
+                            
+                            # If we have a stack trace and this is a new log, save the stack trace
+                            if current_stack_trace and is_new_log:
+                                stack_trace_text = "\n".join(current_stack_trace)
+                                stack_trace_batch.append((current_log_id, stack_trace_text))
+                                current_stack_trace = []
+                                file_stack_traces += 1
+                            
+                            if is_new_log:
+                                # Hand the full batch to the writer before starting a new
+                                # entry, so the entry still being built is never shared
+                                if len(batch) >= BATCH_SIZE:
+                                    write_queue.put((LOG_INSERT_SQL, log_rows(batch)))
+                                    batch = []
+                                
+                                # This is a new log entry; message and raw_log are kept as
+                                # fragment lists so continuation lines can be appended in place
                                 has_stack_trace = 0
-                                batch.append((
+                                current_log_id = next_log_id
+                                next_log_id += 1
+                                batch.append([
+                                    current_log_id,
                                     parsed["timestamp"],
-                                    parsed.get("thread", ""),
+                                    parsed["thread"],
                                     parsed["level"],
                                     parsed["module"],
-                                    parsed["message"],
+                                    [parsed["message"]],
                                     parsed["source_file"],
-                                    parsed["raw_log"],
+                                    [parsed["raw_log"]],
                                     has_stack_trace
-                                ))
+                                ])
                                 file_logs += 1
-                                current_log_entry = parsed
-                            else:
-                                error_batch.append((
-                                    line,
-                                    log_file,
-                                    parsed.get("error", "Unknown parsing error")
-                                ))
-                                file_errors += 1
-                                current_log_entry = None
-                        elif parsed.get("is_stack_trace", False):
-                            # This is a stack trace line
-                            current_stack_trace.append(parsed["stack_trace_line"])
-                            
-                            # If we have a current log entry, mark it as having a stack trace
-                            if current_log_entry and batch:
-                                # Update the last entry in the batch to indicate it has a stack trace
-                                last_entry = list(batch[-1])
-                                last_entry[7] = 1  # Set has_stack_trace to 1
-                                batch[-1] = tuple(last_entry)
-                        else:
-                            # This is a continuation of the previous log or an error
-                            if current_log_entry:
-                                # Append to the message of the current log entry
-                                if batch:
-                                    last_entry = list(batch[-1])
-                                    last_entry[4] += "\n" + line  # Append to message
-                                    last_entry[6] += "\n" + line  # Append to raw_log
-                                    batch[-1] = tuple(last_entry)
+                            elif current_log_id is not None:
+                                last_entry = batch[-1]
+                                if kind == STACK:
+                                    # This is a stack trace line; mark the current entry as having one
+                                    current_stack_trace.append(parsed["stack_trace_line"])
+                                    last_entry[8] = 1
+                                else:
+                                    # This is a continuation of the current log entry
+                                    last_entry[5].append(line)  # Append to message
+                                    last_entry[7].append(line)  # Append to raw_log
                             else:
                                 error_batch.append((
                                     line,
@@ -251,85 +371,62 @@ def process_log_files(conn, cursor):
                                     "Continuation line without a parent log entry"
                                 ))
                                 file_errors += 1
-                        
-                        # Insert in batches for better performance
-                        if len(batch) >= batch_size:
-                            cursor.executemany(
-                                "INSERT INTO logs (timestamp, thread, level, module, message, source_file, raw_log, has_stack_trace) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                                batch
-                            )
-                            # Get the ID of the last inserted log for stack traces
-                            if current_stack_trace:
-                                last_log_id = cursor.lastrowid
-                            batch = []
-                            
-                        if len(error_batch) >= batch_size:
-                            cursor.executemany(
-                                "INSERT INTO parsing_errors (line, source_file, error_message) VALUES (?, ?, ?)",
-                                error_batch
-                            )
-                            error_batch = []
                             
-                        if len(stack_trace_batch) >= batch_size:
-                            cursor.executemany(
-                                "INSERT INTO stack_traces (log_id, stack_trace) VALUES (?, ?)",
-                                stack_trace_batch
-                            )
-                            stack_trace_batch = []
-                            
-                        # Commit every 100,000 lines to avoid transaction getting too large
-                        if line_count % 100000 == 0:
-                            conn.commit()
-                            logger.info(f"  Processed {line_count} lines...")
+                            if len(error_batch) >= BATCH_SIZE:
+                                write_queue.put((ERROR_INSERT_SQL, error_batch))
+                                error_batch = []
+                                
+                            if len(stack_trace_batch) >= BATCH_SIZE:
+                                write_queue.put((STACK_TRACE_INSERT_SQL, stack_trace_batch))
+                                stack_trace_batch = []
+                                
+                            # Report progress; the whole file is committed in one transaction below
+                            if line_count % 100000 == 0:
+                                logger.info("  Processed %d lines...", line_count)
+                        
+                        except Exception as e:
+                            error_batch.append((
+                                line,
+                                log_file,
+                                f"Exception: {str(e)}"
+                            ))
+                            file_errors += 1
                     
-                    except Exception as e:
-                        error_batch.append((
-                            line,
-                            log_file,
-                            f"Exception: {str(e)}"
-                        ))
-                        file_errors += 1
-                
-                # Insert any remaining logs
-                if batch:
-                    cursor.executemany(
-                        "INSERT INTO logs (timestamp, thread, level, module, message, source_file, raw_log, has_stack_trace) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                        batch
-                    )
-                    # Get the ID of the last inserted log for stack traces
+                    # Insert any remaining logs
+                    if batch:
+                        write_queue.put((LOG_INSERT_SQL, log_rows(batch)))
+                    
+                    # Insert the final stack trace if there is one
                     if current_stack_trace:
-                        last_log_id = cursor.lastrowid
-                
-                # Insert the final stack trace if there is one
-                if current_stack_trace and last_log_id is not None:
-                    stack_trace_text = "\n".join(current_stack_trace)
-                    stack_trace_batch.append((last_log_id, stack_trace_text))
-                    file_stack_traces += 1
-                
-                if error_batch:
-                    cursor.executemany(
-                        "INSERT INTO parsing_errors (line, source_file, error_message) VALUES (?, ?, ?)",
-                        error_batch
-                    )
+                        stack_trace_text = "\n".join(current_stack_trace)
+                        stack_trace_batch.append((current_log_id, stack_trace_text))
+                        file_stack_traces += 1
                     
-                if stack_trace_batch:
-                    cursor.executemany(
-                        "INSERT INTO stack_traces (log_id, stack_trace) VALUES (?, ?)",
-                        stack_trace_batch
-                    )
-                
-                conn.commit()
-                
-                total_logs += file_logs
-                total_stack_traces += file_stack_traces
-                total_errors += file_errors
-                
-                logger.info(f"Finished processing {log_file}: {file_logs} logs, {file_stack_traces} stack traces, {file_errors} errors")
+                    if error_batch:
+                        write_queue.put((ERROR_INSERT_SQL, error_batch))
+                        
+                    if stack_trace_batch:
+                        write_queue.put((STACK_TRACE_INSERT_SQL, stack_trace_batch))
+            finally:
+                write_queue.put(None)
+                writer.join()
+            
+            if writer_errors:
+                raise writer_errors[0]
+            
+            cursor.execute("COMMIT")
+            
+            total_logs += file_logs
+            total_stack_traces += file_stack_traces
+            total_errors += file_errors
+            
+            logger.info("Finished processing %s: %d logs, %d stack traces, %d errors", log_file, file_logs, file_stack_traces, file_errors)
         
         except Exception as e:
-            logger.error(f"Error processing {log_file}: {str(e)}")
+            logger.error("Error processing %s: %s", log_file, e)
             traceback.print_exc()
             conn.rollback()
+            next_log_id = file_first_log_id
     
     return total_logs, total_stack_traces, total_errors
 
@@ -346,7 +443,7 @@ def create_indexes(conn, cursor):
     conn.commit()
 
 def main():
-    logger.info(f"Creating log database: {DB_FILE}")
+    logger.info("Creating log database: %s", DB_FILE)
     
     try:
         conn, cursor = create_database()
@@ -355,6 +452,9 @@ def main():
             total_logs, total_stack_traces, total_errors = process_log_files(conn, cursor)
             create_indexes(conn, cursor)
             
+            # Fold the write-ahead log back into the database file
+            cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            
             # Get stats
             cursor.execute("SELECT COUNT(*) FROM logs")
             log_count = cursor.fetchone()[0]
@@ -369,10 +469,10 @@ def main():
             cursor.execute("SELECT level, COUNT(*) as count FROM logs GROUP BY level ORDER BY count DESC")
             level_counts = cursor.fetchall()
             
-            logger.info(f"\nDatabase created successfully!")
-            logger.info(f"Total regular logs: {log_count}")
-            logger.info(f"Total stack traces: {stack_trace_count}")
-            logger.info(f"Total parsing errors: {error_count}")
+            logger.info("\nDatabase created successfully!")
+            logger.info("Total regular logs: %d", log_count)
+            logger.info("Total stack traces: %d", stack_trace_count)
+            logger.info("Total parsing errors: %d", error_count)
             
             if level_counts:
                 level_distribution = "\nLog level distribution:"
@@ -381,13 +481,13 @@ def main():
                         level_distribution += f"\n  {level}: {count}"
                 logger.info(level_distribution)
             
-            logger.info(f"Database file: {os.path.abspath(DB_FILE)}")
+            logger.info("Database file: %s", os.path.abspath(DB_FILE))
             
         finally:
             conn.close()
     
     except Exception as e:
-        logger.error(f"Error: {str(e)}")
+        logger.error("Error: %s", e)
         traceback.print_exc()
         sys.exit(1)
 
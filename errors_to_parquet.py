@@ -1,11 +1,24 @@
 #!/usr/bin/env python3
 import sqlite3
-import pandas as pd
+import itertools
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import logging
 import os
+import queue
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+# ADBC streams SQLite results straight into Arrow record batches
+try:
+    import adbc_driver_sqlite.dbapi as adbc_sqlite
+except ImportError:
+    adbc_sqlite = None
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -14,102 +27,286 @@ logging.basicConfig(
 )
 logger = logging.getLogger("errors_to_parquet")
 
+# Rows per Arrow record batch (and parquet write) when streaming query results
+FETCH_BATCH_SIZE = 100_000
+
+# Parquet output defaults: ZSTD level 3 with dictionary encoding and large row groups
+DEFAULT_COMPRESSION = "zstd"
+DEFAULT_COMPRESSION_LEVEL = 3
+ROW_GROUP_SIZE = 500_000
+
+# Codecs that take no compression level
+UNLEVELED_COMPRESSION = ["snappy", "none"]
+
+# Row groups queued for the background parquet writer thread. One is enough to
+# overlap a write with the fetch; each export then holds at most three row groups
+# (one being written, one queued, one being buffered) of ROW_GROUP_SIZE rows
+WRITE_QUEUE_SIZE = 1
+
+# Low-cardinality text columns written as Arrow dictionary (categorical) columns
+DEFAULT_CATEGORICAL_COLUMNS = ["level", "module", "thread", "source_file"]
+
+# Columns exported from each table, in table order
+LOG_COLUMNS = ["id", "timestamp", "thread", "level", "module", "message", "source_file", "raw_log", "has_stack_trace"]
+PARSING_ERROR_COLUMNS = ["id", "line", "source_file", "error_message", "timestamp"]
+STACK_TRACE_COLUMNS = ["id", "log_id", "stack_trace"]
+
+# Indexes the export queries rely on (create_log_db.py builds the same ones)
+EXPORT_INDEXES = {
+    "idx_logs_level": "CREATE INDEX IF NOT EXISTS idx_logs_level ON logs (level)",
+    "idx_stack_traces_log_id": "CREATE INDEX IF NOT EXISTS idx_stack_traces_log_id ON stack_traces (log_id)",
+}
+
 def connect_to_db(db_path="logs.db"):
     """Connect to the SQLite database"""
     try:
-        logger.info(f"Connecting to database: {db_path}")
+        logger.info("Connecting to database: %s", db_path)
         conn = sqlite3.connect(db_path)
+        # Tune the connection for large read-heavy scans
+        conn.executescript('''
+        PRAGMA temp_store = MEMORY;
+        PRAGMA cache_size = -65536;
+        PRAGMA mmap_size = 268435456;
+        ''')
         return conn
     except sqlite3.Error as e:
-        logger.error(f"Error connecting to database: {e}")
+        logger.error("Error connecting to database: %s", e)
         sys.exit(1)
 
-def query_parsing_errors(conn, limit=None):
+def enable_wal(conn):
+    """Switch the database to WAL so the export workers read alongside any writer"""
+    # journal_mode is stored in the database file, so this needs write access;
+    # a read-only database keeps its journal mode and is exported as is
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+    except sqlite3.OperationalError as e:
+        logger.info("Could not switch database to WAL mode: %s", e)
+
+def ensure_indexes(conn):
+    """Create any missing indexes used by the export queries"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='index'")
+    existing = {row[0] for row in cursor.fetchall()}
+    missing = [name for name in EXPORT_INDEXES if name not in existing]
+    if not missing:
+        return
+    
+    created = 0
+    for name in missing:
+        try:
+            logger.info("Creating missing index %s", name)
+            cursor.execute(EXPORT_INDEXES[name])
+            created += 1
+        except sqlite3.Error as e:
+            logger.warning("Could not create index %s: %s", name, e)
+    
+    if created:
+        # Refresh planner statistics so the new indexes get used
+        cursor.execute("ANALYZE")
+        conn.commit()
+
+def get_db_file(conn):
+    """Return the file backing the connection's main database ('' if in memory)"""
+    for _, name, path in conn.execute("PRAGMA database_list"):
+        if name == "main":
+            return path
+    return ""
+
+def iter_adbc_batches(db_file, query, batch_size):
+    """Yield record batches for a query over a dedicated ADBC connection"""
+    with adbc_sqlite.connect(db_file) as adbc_conn, adbc_conn.cursor() as cursor:
+        cursor.adbc_statement.set_options(**{"adbc.sqlite.query.batch_rows": str(batch_size)})
+        cursor.execute(query)
+        yield from cursor.fetch_record_batch()
+
+def iter_cursor_batches(cursor, batch_size):
+    """Build record batches column by column from a sqlite3 cursor, sharing the first batch's schema"""
+    names = [column[0] for column in cursor.description]
+    schema = None
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        # Copy the row tuples into a 2-D object array so each column converts as one slice
+        values = np.empty((len(rows), len(names)), dtype=object)
+        values[:] = rows
+        if schema is None:
+            # A column that is entirely NULL in the first batch has no type yet; assume text
+            arrays = [pa.array(values[:, i], from_pandas=True) for i in range(len(names))]
+            schema = pa.schema([(name, pa.string() if pa.types.is_null(array.type) else array.type)
+                                for name, array in zip(names, arrays)])
+        # Every batch must match the parquet schema
+        arrays = [pa.array(values[:, i], type=field.type, from_pandas=True) for i, field in enumerate(schema)]
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+def fetch_arrow(conn, query, batch_size=FETCH_BATCH_SIZE):
+    """Run a query and return an iterator of pyarrow RecordBatches over its results"""
+    db_file = get_db_file(conn)
+    if adbc_sqlite is not None and db_file:
+        batches = iter_adbc_batches(db_file, query, batch_size)
+        # Pull the first batch so query errors are raised here, not by the writer
+        first = next(batches, None)
+        if first is None:
+            return iter(())
+        # The driver types each column from the first batch, and an all-NULL column
+        # becomes INT64 there, so later text values would be rejected mid-export
+        if not any(column.null_count == first.num_rows for column in first.columns):
+            return itertools.chain([first], batches)
+        batches.close()
+        logger.info("Column with no values in the first batch; reading through sqlite3 instead of ADBC")
+    
+    cursor = conn.execute(query)
+    return iter_cursor_batches(cursor, batch_size)
+
+def query_parsing_errors(conn, limit=None, columns=PARSING_ERROR_COLUMNS):
     """Query parsing errors from the database"""
     try:
         logger.info("Querying parsing_errors table")
-        query = "SELECT * FROM parsing_errors"
+        query = f"SELECT {', '.join(columns)} FROM parsing_errors"
         if limit:
             query += f" LIMIT {limit}"
         
-        # Read directly into pandas DataFrame
-        df = pd.read_sql_query(query, conn)
-        logger.info(f"Retrieved {len(df)} parsing error records")
-        return df
+        # Stream the results as Arrow record batches
+        return fetch_arrow(conn, query)
     except Exception as e:
-        logger.error(f"Error querying parsing_errors: {e}")
-        return pd.DataFrame()
+        logger.error("Error querying parsing_errors: %s", e)
+        return iter(())
 
-def query_error_logs(conn, limit=None):
+def query_error_logs(conn, limit=None, columns=LOG_COLUMNS):
     """Query error and critical logs from the logs table"""
     try:
         logger.info("Querying error logs from logs table")
-        query = "SELECT * FROM logs WHERE level IN ('ERROR', 'CRITICAL')"
+        query = f"SELECT {', '.join(columns)} FROM logs WHERE level IN ('ERROR', 'CRITICAL')"
         if limit:
             query += f" LIMIT {limit}"
         
-        # Read directly into pandas DataFrame
-        df = pd.read_sql_query(query, conn)
-        logger.info(f"Retrieved {len(df)} error log records")
-        return df
+        # Stream the results as Arrow record batches
+        return fetch_arrow(conn, query)
     except Exception as e:
-        logger.error(f"Error querying logs: {e}")
-        return pd.DataFrame()
+        logger.error("Error querying logs: %s", e)
+        return iter(())
 
-def query_stack_traces(conn, log_ids=None, limit=None):
-    """Query stack traces for the given log IDs"""
+def query_stack_traces(conn, limit=None, columns=STACK_TRACE_COLUMNS):
+    """Query stack traces belonging to error and critical logs"""
     try:
-        if log_ids is not None and len(log_ids) > 0:
-            logger.info(f"Querying stack traces for {len(log_ids)} log IDs")
-            # Convert log_ids to a comma-separated string for the IN clause
-            log_ids_str = ','.join(str(id) for id in log_ids)
-            query = f"SELECT * FROM stack_traces WHERE log_id IN ({log_ids_str})"
-            if limit:
-                query += f" LIMIT {limit}"
+        logger.info("Querying stack traces for error logs")
+        # Match the logs query_error_logs exports, including its limit
+        error_ids = "SELECT id FROM logs WHERE level IN ('ERROR', 'CRITICAL')"
+        if limit:
+            error_ids += f" LIMIT {limit}"
+        query = f"SELECT {', '.join(columns)} FROM stack_traces WHERE log_id IN ({error_ids})"
+        if limit:
+            query += f" LIMIT {limit}"
             
-            # Read directly into pandas DataFrame
-            df = pd.read_sql_query(query, conn)
-            logger.info(f"Retrieved {len(df)} stack trace records")
-            return df
-        else:
-            logger.info("No log IDs provided for stack traces query")
-            return pd.DataFrame()
+        # Stream the results as Arrow record batches
+        return fetch_arrow(conn, query)
     except Exception as e:
-        logger.error(f"Error querying stack_traces: {e}")
-        return pd.DataFrame()
+        logger.error("Error querying stack_traces: %s", e)
+        return iter(())
 
-def query_all_logs(conn, limit=None):
+def query_all_logs(conn, limit=None, columns=LOG_COLUMNS):
     """Query all logs from the logs table"""
     try:
         logger.info("Querying all logs from logs table")
-        query = "SELECT * FROM logs"
+        query = f"SELECT {', '.join(columns)} FROM logs"
         if limit:
             query += f" LIMIT {limit}"
         
-        # Read directly into pandas DataFrame
-        df = pd.read_sql_query(query, conn)
-        logger.info(f"Retrieved {len(df)} log records")
-        return df
+        # Stream the results as Arrow record batches
+        return fetch_arrow(conn, query)
     except Exception as e:
-        logger.error(f"Error querying logs: {e}")
-        return pd.DataFrame()
+        logger.error("Error querying logs: %s", e)
+        return iter(())
+
+def encode_categorical_columns(batches, columns):
+    """Dictionary-encode the given columns of each record batch"""
+    for batch in batches:
+        names = batch.schema.names
+        arrays = [pc.dictionary_encode(array) if name in columns else array
+                  for name, array in zip(names, batch.columns)]
+        yield pa.RecordBatch.from_arrays(arrays, names=names)
+
+def write_row_groups(writer, write_queue, errors):
+    """Writer thread: write tables from the queue as row groups until a None sentinel"""
+    while True:
+        table = write_queue.get()
+        if table is None:
+            break
+        # After a failure keep draining so the producer never blocks on a full queue
+        if errors:
+            continue
+        try:
+            writer.write_table(table, row_group_size=ROW_GROUP_SIZE)
+        except Exception as e:
+            errors.append(e)
 
-def save_to_parquet(df, output_path=None, prefix="errors"):
-    """Save DataFrame to parquet file"""
+def save_to_parquet(batches, output_path=None, prefix="errors", compression=DEFAULT_COMPRESSION, compression_level=None,
+                    categorical_columns=DEFAULT_CATEGORICAL_COLUMNS):
+    """Stream record batches to a parquet file and return the number of records saved"""
+    if categorical_columns:
+        batches = encode_categorical_columns(batches, categorical_columns)
+    batches = iter(batches)
+    first = next(batches, None)
+    if first is None:
+        logger.info("No %s records to save", prefix)
+        return 0
+    
     if output_path is None:
         # Generate default filename with timestamp
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         output_path = f"{prefix}_{timestamp}.parquet"
     
+    if compression_level is None and compression == DEFAULT_COMPRESSION:
+        compression_level = DEFAULT_COMPRESSION_LEVEL
+    
     try:
-        logger.info(f"Saving {len(df)} records to {output_path}")
-        df.to_parquet(output_path, index=False)
-        logger.info(f"Successfully saved parquet file to {output_path}")
-        return output_path
+        logger.info("Saving %s records to %s", prefix, output_path)
+        records = 0
+        pending = []
+        pending_rows = 0
+        with pq.ParquetWriter(output_path, first.schema, compression=compression,
+                              compression_level=compression_level, use_dictionary=True) as writer:
+            # Encoding and compression run on a writer thread (pyarrow releases
+            # the GIL) so they overlap with fetching the next batches
+            write_queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+            errors = []
+            writer_thread = threading.Thread(target=write_row_groups, args=(writer, write_queue, errors))
+            writer_thread.start()
+            try:
+                # Buffer batches into ROW_GROUP_SIZE row groups so memory stays bounded
+                # while the compressor still sees large blocks
+                for batch in itertools.chain([first], batches):
+                    pending.append(batch)
+                    pending_rows += batch.num_rows
+                    records += batch.num_rows
+                    if pending_rows >= ROW_GROUP_SIZE:
+                        write_queue.put(pa.Table.from_batches(pending))
+                        pending = []
+                        pending_rows = 0
+                if pending:
+                    write_queue.put(pa.Table.from_batches(pending))
+            finally:
+                write_queue.put(None)
+                writer_thread.join()
+            if errors:
+                raise errors[0]
+        logger.info("Successfully saved %d records to %s", records, output_path)
+        return records
     except Exception as e:
-        logger.error(f"Error saving parquet file: {e}")
+        logger.error("Error saving parquet file: %s", e)
+        # Don't leave a truncated file that looks like a complete export
+        if os.path.exists(output_path):
+            os.remove(output_path)
         sys.exit(1)
 
+def export_query(db_path, query_func, query_args, output_path, prefix, parquet_options):
+    """Run a query over a dedicated connection and save its results to parquet"""
+    conn = connect_to_db(db_path)
+    try:
+        return save_to_parquet(query_func(conn, **query_args), output_path, prefix, **parquet_options)
+    finally:
+        conn.close()
+
 def get_db_stats(conn):
     """Get statistics about the database tables"""
     stats = {}
@@ -120,19 +317,15 @@ def get_db_stats(conn):
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
         tables = [row[0] for row in cursor.fetchall()]
         
-        # Get row counts for each table
-        for table in tables:
-            cursor.execute(f"SELECT COUNT(*) FROM {table}")
-            count = cursor.fetchone()[0]
-            stats[table] = count
-            
-        # Get error log count
-        cursor.execute("SELECT COUNT(*) FROM logs WHERE level IN ('ERROR', 'CRITICAL')")
-        stats['error_logs'] = cursor.fetchone()[0]
+        # Get row counts for each table and the error log count in one statement
+        counts = [f"SELECT '{table}', COUNT(*) FROM \"{table}\"" for table in tables]
+        counts.append("SELECT 'error_logs', COUNT(*) FROM logs WHERE level IN ('ERROR', 'CRITICAL')")
+        cursor.execute(" UNION ALL ".join(counts))
+        stats.update(cursor.fetchall())
         
         return stats
     except Exception as e:
-        logger.error(f"Error getting database stats: {e}")
+        logger.error("Error getting database stats: %s", e)
         return {}
 
 def main():
@@ -146,15 +339,34 @@ def main():
                        default="all", help="Type of errors to export (default: all)")
     parser.add_argument("--verbose", "-v", action="store_true", 
                        help="Show detailed database statistics")
+    parser.add_argument("--compression", choices=["zstd", "lz4", "snappy", "brotli", "gzip", "none"],
+                       default=DEFAULT_COMPRESSION, help=f"Parquet compression codec (default: {DEFAULT_COMPRESSION})")
+    parser.add_argument("--compression-level", type=int,
+                       help=f"Compression level for the codec (default: {DEFAULT_COMPRESSION_LEVEL} for zstd)")
+    parser.add_argument("--categorical-cols", default=",".join(DEFAULT_CATEGORICAL_COLUMNS),
+                       help="Comma-separated columns to store as categorical (default: %(default)s)")
+    parser.add_argument("--columns", help="Comma-separated logs table columns to export (default: all)")
     args = parser.parse_args()
     
+    if args.compression_level is not None and args.compression in UNLEVELED_COMPRESSION:
+        parser.error(f"--compression-level is not supported with --compression {args.compression}")
+    
+    log_columns = LOG_COLUMNS
+    if args.columns:
+        log_columns = [col for col in args.columns.split(",") if col]
+        unknown = [col for col in log_columns if col not in LOG_COLUMNS]
+        if unknown:
+            parser.error(f"unknown logs columns: {', '.join(unknown)}")
+    parquet_options = {
+        "compression": args.compression,
+        "compression_level": args.compression_level,
+        "categorical_columns": [col for col in args.categorical_cols.split(",") if col]
+    }
+    
     # Connect to database
     conn = connect_to_db(args.db)
-    
-    # Initialize empty DataFrames
-    parsing_errors_df = pd.DataFrame()
-    error_logs_df = pd.DataFrame()
-    stack_traces_df = pd.DataFrame()
+    enable_wal(conn)
+    ensure_indexes(conn)
     
     # Print database statistics
     if args.verbose:
@@ -164,52 +376,48 @@ def main():
             print(f"  {table}: {count} records")
         print("")
     
-    # Query data based on the requested type
-    if args.type in ["parsing", "all"]:
-        parsing_errors_df = query_parsing_errors(conn, args.limit)
-        if not parsing_errors_df.empty:
-            save_to_parquet(parsing_errors_df, 
-                           args.output if args.type == "parsing" else None,
-                           "parsing_errors")
+    # Close database connection
+    conn.close()
     
+    # Each export is independent, so run them in parallel with a connection per worker
+    exports = {}
+    if args.type in ["parsing", "all"]:
+        exports["parsing_errors"] = (query_parsing_errors, {"limit": args.limit},
+                                     args.output if args.type == "parsing" else None)
     if args.type in ["logs", "all"]:
-        error_logs_df = query_error_logs(conn, args.limit)
-        if not error_logs_df.empty:
-            save_to_parquet(error_logs_df, 
-                           args.output if args.type == "logs" else None,
-                           "error_logs")
-    
-    if args.type in ["stack_traces", "all"] and not error_logs_df.empty:
-        # Get log IDs with stack traces
-        log_ids_with_traces = error_logs_df[error_logs_df['has_stack_trace'] == 1]['id'].tolist()
-        if log_ids_with_traces:
-            stack_traces_df = query_stack_traces(conn, log_ids_with_traces, args.limit)
-            if not stack_traces_df.empty:
-                save_to_parquet(stack_traces_df, 
-                               args.output if args.type == "stack_traces" else None,
-                               "stack_traces")
-    
+        exports["error_logs"] = (query_error_logs, {"limit": args.limit, "columns": log_columns},
+                                 args.output if args.type == "logs" else None)
+    if args.type in ["stack_traces", "all"]:
+        exports["stack_traces"] = (query_stack_traces, {"limit": args.limit},
+                                   args.output if args.type == "stack_traces" else None)
     if args.type == "full_db":
         # Export entire logs table
-        all_logs_df = query_all_logs(conn, args.limit)
-        if not all_logs_df.empty:
-            save_to_parquet(all_logs_df, args.output, "all_logs")
-            print(f"  All logs exported: {len(all_logs_df)}")
+        exports["all_logs"] = (query_all_logs, {"limit": args.limit, "columns": log_columns}, args.output)
     
-    # Close database connection
-    conn.close()
+    with ThreadPoolExecutor(max_workers=len(exports)) as executor:
+        futures = {prefix: executor.submit(export_query, args.db, query_func, query_args, output_path, prefix,
+                                           parquet_options)
+                   for prefix, (query_func, query_args, output_path) in exports.items()}
+        counts = {prefix: future.result() for prefix, future in futures.items()}
+    
+    parsing_errors_count = counts.get("parsing_errors", 0)
+    error_logs_count = counts.get("error_logs", 0)
+    stack_traces_count = counts.get("stack_traces", 0)
+    all_logs_count = counts.get("all_logs", 0)
+    if all_logs_count:
+        print(f"  All logs exported: {all_logs_count}")
     
     # Print summary
     print(f"\nExport Summary:")
-    if not parsing_errors_df.empty:
-        print(f"  Parsing errors exported: {len(parsing_errors_df)}")
-    if not error_logs_df.empty:
-        print(f"  Error logs exported: {len(error_logs_df)}")
-    if not stack_traces_df.empty:
-        print(f"  Stack traces exported: {len(stack_traces_df)}")
-    
-    if parsing_errors_df.empty and error_logs_df.empty and stack_traces_df.empty:
+    if parsing_errors_count:
+        print(f"  Parsing errors exported: {parsing_errors_count}")
+    if error_logs_count:
+        print(f"  Error logs exported: {error_logs_count}")
+    if stack_traces_count:
+        print(f"  Stack traces exported: {stack_traces_count}")
+    
+    if not parsing_errors_count and not error_logs_count and not stack_traces_count:
         print("  No error records found or exported")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main() 
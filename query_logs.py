@@ -2,7 +2,6 @@
 import sqlite3
 import sys
 import csv
-import io
 import logging
 
 # Configure logging
@@ -13,44 +12,64 @@ logging.basicConfig(
 )
 logger = logging.getLogger("query_logs")
 
+# Rows fetched per batch when streaming query results
+FETCH_SIZE = 10_000
+
 def connect_to_db():
     """Connect to the SQLite database"""
     try:
         conn = sqlite3.connect("logs.db")
         conn.row_factory = sqlite3.Row  # This enables column access by name
+        # Tune the connection for large read-heavy scans
+        conn.executescript('''
+        PRAGMA temp_store = MEMORY;
+        PRAGMA cache_size = -65536;
+        PRAGMA mmap_size = 268435456;
+        ''')
         return conn
     except sqlite3.Error as e:
-        logger.error(f"Error connecting to database: {e}")
+        logger.error("Error connecting to database: %s", e)
         sys.exit(1)
 
+def iter_batches(cursor):
+    """Yield successive batches of rows from an executed cursor"""
+    while True:
+        rows = cursor.fetchmany()
+        if not rows:
+            break
+        yield rows
+
 def execute_query(conn, query):
-    """Execute a SQL query and return the results"""
+    """Execute a SQL query and return an iterator over batches of results"""
     try:
         cursor = conn.cursor()
+        cursor.arraysize = FETCH_SIZE
         cursor.execute(query)
-        return cursor.fetchall()
+        return iter_batches(cursor)
     except sqlite3.Error as e:
-        logger.error(f"Error executing query: {e}")
+        logger.error("Error executing query: %s", e)
         return None
 
-def output_as_csv(rows):
-    """Output query results as CSV"""
-    if not rows:
-        return
-    
-    # Create a CSV string
-    output = io.StringIO()
-    writer = csv.writer(output)
+def output_as_csv(batches):
+    """Stream query results to stdout as CSV and return the number of rows written"""
+    # Let stdout buffer whole batches, even on a terminal, instead of writing line by line
+    if hasattr(sys.stdout, "reconfigure"):
+        sys.stdout.reconfigure(line_buffering=False, write_through=False)
     
-    # Write header
-    writer.writerow(rows[0].keys())
-    
-    # Write data rows
-    for row in rows:
-        writer.writerow(row)
+    writer = None
+    count = 0
+    for rows in batches:
+        if writer is None:
+            writer = csv.writer(sys.stdout)
+            # Write header
+            writer.writerow(rows[0].keys())
+        
+        # Write data rows
+        writer.writerows(rows)
+        sys.stdout.flush()
+        count += len(rows)
     
-    # Print the CSV
-    print(output.getvalue())
+    return count
 
 def main():
     conn = connect_to_db()
@@ -58,12 +77,16 @@ def main():
     if len(sys.argv) > 1:
         # If a query is provided as an argument, execute it
         query = " ".join(sys.argv[1:])
-        logger.info(f"Executing query: {query}")
+        logger.info("Executing query: %s", query)
         results = execute_query(conn, query)
         
-        if results:
-            logger.info(f"Query returned {len(results)} rows")
-            output_as_csv(results)
+        if results is not None:
+            try:
+                count = output_as_csv(results)
+                logger.info("Query returned %d rows", count)
+            except sqlite3.Error as e:
+                # Errors hit while stepping through the rows surface during the fetch
+                logger.error("Error executing query: %s", e)
     else:
         # Get database info
         cursor = conn.cursor()